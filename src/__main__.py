@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import click
+
+from src.data import make_dataset
+from src.features import build_features
+from src.models import compare_models, train_model
+from src.visualization import flowchart, visualize
+
+
+@click.group()
+def cli():
+    """
+    Pipeline entry points, run as 'python -m src <command>'
+    """
+    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+
+cli.add_command(make_dataset.main, name="data")
+cli.add_command(build_features.main, name="features")
+cli.add_command(train_model.main, name="train")
+cli.add_command(compare_models.main, name="compare")
+cli.add_command(visualize.main, name="figures")
+cli.add_command(flowchart.main, name="flowchart")
+
+
+if __name__ == "__main__":
+    cli()
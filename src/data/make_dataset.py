@@ -3,7 +3,8 @@ import logging
 from pathlib import Path
 
 import click
-import geopandas as gpd
+
+from src.utils import require_files
 
 
 @click.command()
@@ -40,6 +41,9 @@ def main(input_filepath, output_filepath, min_density, districts):
     plot_output_fp = output_fp / "spatial_income_1880.gpkg"
     water_output_fp = output_fp / "water_1913.gpkg"
     churches_output_fp = output_fp / "churches.gpkg"
+    require_files(plot_data_fp, old_areas_fp, water_fp, churches_fp)
+
+    import geopandas as gpd
 
     logger.info(f"Reading data from {plot_data_fp}")
     data = gpd.read_file(plot_data_fp).set_crs(epsg=3067)
@@ -82,9 +86,3 @@ def main(input_filepath, output_filepath, min_density, districts):
     water.to_file(water_output_fp)
     churches.to_file(churches_output_fp)
 
-
-if __name__ == "__main__":
-    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
-
-    main()
@@ -3,10 +3,8 @@ import logging
 from pathlib import Path
 
 import click
-import numpy as np
-import geopandas as gpd
-import pandas as pd
-from scipy.spatial import distance_matrix
+
+from src.utils import require_files
 
 
 @click.command()
@@ -31,6 +29,12 @@ def main(
     income_output_fp = output_fp / "income_tax_record_1880.csv"
 
     churches_data_fp = input_fp / "churches.gpkg"
+    require_files(plot_data_fp, income_data_fp, churches_data_fp)
+
+    import numpy as np
+    import geopandas as gpd
+    import pandas as pd
+    from scipy.spatial import distance_matrix
 
     logger.info(f"Reading data from {plot_data_fp} and {churches_data_fp}")
     data = gpd.read_file(plot_data_fp)
@@ -97,9 +101,3 @@ def main(
     logger.info(f"Saving data to {income_output_fp}")
     tax.to_csv(income_output_fp)
 
-
-if __name__ == "__main__":
-    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
-
-    main()
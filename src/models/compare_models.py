@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import click
+
+from src.utils import require_files
+
+
+def model_loo(model_fp):
+    """Compute PSIS-LOO from the posterior saved in 'model_fp'"""
+    import arviz as az
+
+    posterior = az.InferenceData.from_netcdf(model_fp / "posterior")
+    return az.loo(posterior, pointwise=True)
+
+
+@click.command()
+@click.argument("model_filepaths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--output",
+    "output_filepath",
+    default="reports/figures/model_comparison.csv",
+    type=click.Path(dir_okay=False, writable=True),
+    help="CSV file for the comparison table",
+)
+@click.option(
+    "--n_jobs",
+    default=None,
+    type=click.IntRange(1, 64),
+    help="Number of worker processes, default one per model",
+)
+def main(
+    model_filepaths,
+    output_filepath,
+    n_jobs,
+):
+    """
+    Compare models saved with log-likelihood in 'model_filepaths' using PSIS-LOO
+    """
+    logger = logging.getLogger(__name__)
+    model_fps = [Path(fp) for fp in model_filepaths]
+    if len(model_fps) < 2:
+        raise click.BadParameter("at least two model directories are needed", param_hint="MODEL_FILEPATHS")
+    names = [fp.name for fp in model_fps]
+    if len(set(names)) != len(names):
+        raise click.BadParameter("model directories must have distinct names", param_hint="MODEL_FILEPATHS")
+    if not Path(output_filepath).parent.is_dir():
+        raise click.BadParameter(
+            f"directory '{Path(output_filepath).parent}' does not exist", param_hint="'--output'"
+        )
+
+    require_files(*[fp / "posterior" for fp in model_fps])
+
+    import netCDF4
+
+    for fp in model_fps:
+        with netCDF4.Dataset(fp / "posterior") as posterior:
+            if "log_likelihood" not in posterior.groups:
+                raise click.FileError(
+                    str(fp / "posterior"), hint="no log_likelihood group, train with '--log_likelihood'"
+                )
+
+    import arviz as az
+
+    logger.info(f"Computing PSIS-LOO for {len(model_fps)} models")
+    with ProcessPoolExecutor(max_workers=n_jobs or len(model_fps)) as executor:
+        loos = dict(zip(names, executor.map(model_loo, model_fps)))
+
+    for name, loo in loos.items():
+        logger.info(f"{name}: elpd_loo={loo.elpd_loo:.2f}, p_loo={loo.p_loo:.2f}")
+        if loo.warning:
+            logger.warning(f"{name}: Pareto k estimates are high, PSIS-LOO may be unreliable")
+
+    logger.info(f"Saving model comparison to {output_filepath}")
+    comparison = az.compare(loos, ic="loo")
+    comparison.to_csv(output_filepath)
+
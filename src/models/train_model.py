@@ -4,18 +4,106 @@ from pathlib import Path
 
 import click
 import numpy as np
-import pymc as pm
-import pandas as pd
-import geopandas as gpd
-import aesara.tensor as at
-from sklearn.preprocessing import StandardScaler
-from scipy.spatial import distance_matrix
+
+from src.utils import require_files
+
+LENGTH_SCALE_FACTOR = 75  # ρ² is sampled scaled by this factor
+JITTER = 0.01
+
+
+def linear_predictor(β, idx, W, C):
+    """Mean of O from the cluster coefficients 'β', works on arrays and aesara tensors"""
+    return β[idx, 0] + β[idx, 1] * W + β[idx, 2] * C
+
+
+def gp_covariance(η2, ρ2_std, d, jitter, exp=np.exp):
+    """
+    Squared exponential covariance of O over distances 'd' plus the 'jitter'
+    matrix, pass aesara's exp to build it in a model
+    """
+    return η2 * exp(-LENGTH_SCALE_FACTOR * ρ2_std * d ** 2) + jitter
+
+
+def pointwise_log_likelihood(posterior, idx, W, C, d, observed):
+    """
+    Leave-one-out log-likelihood log p(O_i | O_-i) of each plot for every posterior draw.
+
+    O is a single multivariate normal observation, so the joint log-likelihood stored by
+    pymc cannot be used for PSIS-LOO. The conditional densities are computed from the
+    inverse of the covariance matrix, see Bürkner, Gabry & Vehtari (2021),
+    "Efficient leave-one-out cross-validation for Bayesian non-factorized normal
+    and Student-t models".
+    """
+    import xarray as xr
+    from scipy.linalg import cholesky
+    from scipy.linalg.lapack import dpotri
+
+    N = observed.shape[0]
+    post = posterior.posterior
+    β = post["β"].values
+    η2 = post["η²"].values
+    ρ2_std = post["ρ²_scaled"].values
+    n_chains, n_draws = η2.shape
+    jitter = JITTER * np.eye(N)
+
+    log_lik = np.empty((n_chains, n_draws, N), dtype=np.float32)
+    for chain in range(n_chains):
+        for draw in range(n_draws):
+            μ = linear_predictor(β[chain, draw], idx, W, C)
+            K = gp_covariance(η2[chain, draw], ρ2_std[chain, draw], d, jitter)
+            K_inv, _ = dpotri(cholesky(K))
+            K_inv = np.triu(K_inv) + np.triu(K_inv, 1).T
+            g = K_inv @ (observed - μ)
+            c = np.diag(K_inv)
+            log_lik[chain, draw] = -0.5 * np.log(2 * np.pi) + 0.5 * np.log(c) - 0.5 * g ** 2 / c
+
+    return xr.Dataset(
+        {"O": (("chain", "draw", "O_dim_0"), log_lik)},
+        coords={"chain": post.chain, "draw": post.draw, "O_dim_0": np.arange(N)},
+    )
+
+
+THINNABLE_GROUPS = ["prior", "prior_predictive", "posterior_predictive"]
+
+
+def save_inference_data(idata, filepath, drop_groups=(), thin=1, float32=True, compression=4, chunk_draws=100):
+    """
+    Save InferenceData to a netcdf file group by group, leaving out 'drop_groups',
+    keeping every 'thin'th draw of the predictive groups and compressing
+    numeric variables with zlib in chunks of 'chunk_draws' draws.
+    """
+    mode = "w"
+    for group in idata.groups():
+        if group in drop_groups:
+            continue
+        dataset = getattr(idata, group)
+        if thin > 1 and group in THINNABLE_GROUPS and "draw" in dataset.dims:
+            dataset = dataset.isel(draw=slice(None, None, thin))
+        if float32:
+            dataset = dataset.map(
+                lambda x: x.astype("float32") if x.dtype.kind == "f" and x.dtype.itemsize == 8 else x,
+                keep_attrs=True,
+            )
+
+        encoding = {}
+        for name, variable in dataset.data_vars.items():
+            if variable.dtype.kind not in "biuf" or variable.ndim == 0:
+                continue
+            encoding[name] = {"zlib": compression > 0, "complevel": compression}
+            if chunk_draws > 0:
+                encoding[name]["chunksizes"] = tuple(
+                    min(chunk_draws, size) if dim == "draw" else size
+                    for dim, size in zip(variable.dims, variable.shape)
+                )
+
+        dataset.to_netcdf(filepath, mode=mode, group=group, engine="netcdf4", encoding=encoding)
+        mode = "a"
 
 
 @click.command()
 @click.argument("input_filepath", type=click.Path(exists=True))
-@click.argument("model_filepath", type=click.Path())
-@click.argument("figure_filepath", type=click.Path())
+@click.argument("model_filepath", type=click.Path(exists=True, file_okay=False))
+@click.argument("figure_filepath", type=click.Path(exists=True, file_okay=False))
 @click.option(
     "--seed",
     default=42,
@@ -46,6 +134,48 @@ from scipy.spatial import distance_matrix
     type=click.FloatRange(0.5, 0.99),
     help="Target accept threshold for NUTS",
 )
+@click.option(
+    "--model",
+    "model_name",
+    default="gp",
+    type=click.Choice(["gp", "linear"]),
+    help="gp: spatially correlated residuals, linear: independent residuals",
+)
+@click.option(
+    "--log_likelihood/--no_log_likelihood",
+    default=True,
+    help="Store pointwise log-likelihood in the posterior for model comparison",
+)
+@click.option(
+    "--compression",
+    default=4,
+    type=click.IntRange(0, 9),
+    help="zlib compression level of saved models, 0 disables compression",
+)
+@click.option(
+    "--chunk_draws",
+    default=100,
+    type=click.IntRange(0, 2000),
+    help="Number of draws per netcdf chunk, 0 disables chunking",
+)
+@click.option(
+    "--float32/--float64",
+    default=True,
+    help="Downcast saved samples to float32",
+)
+@click.option(
+    "--thin",
+    default=1,
+    type=click.IntRange(1, 100),
+    help="Keep every n-th draw of the prior and predictive samples",
+)
+@click.option(
+    "--drop_group",
+    "drop_groups",
+    multiple=True,
+    type=click.Choice(["prior_predictive", "posterior_predictive", "observed_data", "constant_data", "sample_stats"]),
+    help="InferenceData group left out of the saved models, can be repeated",
+)
 def main(
     input_filepath,
     model_filepath,
@@ -55,12 +185,27 @@ def main(
     draws,
     tune,
     target_accept,
+    model_name,
+    log_likelihood,
+    compression,
+    chunk_draws,
+    float32,
+    thin,
+    drop_groups,
 ):
     """Train models and save them to 'model_filepath'"""
     logger = logging.getLogger(__name__)
     data_fp = Path(input_filepath)
     model_fp = Path(model_filepath)
     figure_fp = Path(figure_filepath)
+    require_files(data_fp / "spatial_income_1880.gpkg")
+
+    import pymc as pm
+    import pandas as pd
+    import geopandas as gpd
+    import aesara.tensor as at
+    from sklearn.preprocessing import StandardScaler
+    from scipy.spatial import distance_matrix
 
     logger.info("Preparing data")
     data = gpd.read_file(data_fp / "spatial_income_1880.gpkg")
@@ -77,7 +222,7 @@ def main(
     xy = pd.DataFrame({"x": data.geometry.x, "y": data.geometry.y, "group": data.group})
     d = distance_matrix(xy, xy)
 
-    logger.info("Training model")
+    logger.info(f"Training {model_name} model")
 
     with pm.Model() as model:
         idx = data.group
@@ -89,11 +234,15 @@ def main(
             "β", mu=θ, cov=np.diagflat(np.array([0.1, 0.1, 0.1])), shape=(N_CLUSTERS, 3)
         )
 
-        η2 = pm.Normal("η²", 1, 0.2)
-        ρ2_std = pm.Normal("ρ²_scaled", 1, 0.2) # scaled by 75
-        K = η2 * at.exp(-75 * ρ2_std * at.power(d, 2)) + np.diag([0.01] * N)
-        μ = β[idx, 0] + β[idx, 1] * W + β[idx, 2] * C
-        O = pm.MvNormal("O", mu=μ, cov=K, shape=N, observed=O_norm)
+        μ = linear_predictor(β, idx, W, C)
+        if model_name == "gp":
+            η2 = pm.Normal("η²", 1, 0.2)
+            ρ2_std = pm.Normal("ρ²_scaled", 1, 0.2)
+            K = gp_covariance(η2, ρ2_std, d, JITTER * np.eye(N), exp=at.exp)
+            O = pm.MvNormal("O", mu=μ, cov=K, shape=N, observed=O_norm)
+        else:
+            σ = pm.HalfNormal("σ", 1)
+            O = pm.Normal("O", mu=μ, sigma=σ, observed=O_norm)
 
         logger.info(f"Drawing {prior_samples} samples from prior distribution")
         prior = pm.sample_prior_predictive(samples=prior_samples, random_seed=seed)
@@ -107,6 +256,7 @@ def main(
             return_inferencedata=True,
             target_accept=target_accept,
             random_seed=seed,
+            idata_kwargs={"log_likelihood": log_likelihood and model_name == "linear"},
         )
         logger.info("Sampling posterior predictive distribution")
         posterior_prediction = pm.sample_posterior_predictive(
@@ -114,23 +264,45 @@ def main(
             random_seed=seed,
         )
 
+    if log_likelihood and model_name == "linear":
+        posterior.log_likelihood["O"] = posterior.log_likelihood["O"].astype("float32")
+
     logger.info("Saving model to netcdf files")
     for file in model_fp.glob("*"):
         file.unlink(missing_ok=True)
-    prior.to_netcdf(model_fp / "prior")
-    posterior.to_netcdf(model_fp / "posterior")
-    posterior_prediction.to_netcdf(model_fp / "posterior_prediction")
+    save_options = dict(
+        drop_groups=drop_groups,
+        thin=thin,
+        float32=float32,
+        compression=compression,
+        chunk_draws=chunk_draws,
+    )
+    save_inference_data(prior, model_fp / "prior", **save_options)
+    save_inference_data(posterior, model_fp / "posterior", **save_options)
+    save_inference_data(posterior_prediction, model_fp / "posterior_prediction", **save_options)
     logger.info("Model saved")
 
+    if log_likelihood and model_name == "gp":
+        logger.info("Calculating pointwise log-likelihood")
+        try:
+            log_lik = pointwise_log_likelihood(
+                posterior,
+                idx=data.group.values,
+                W=data.total_income_ln.values,
+                C=data.distance_from_church_km.values,
+                d=d,
+                observed=O_norm,
+            )
+        except np.linalg.LinAlgError as e:
+            logger.warning(f"Pointwise log-likelihood not saved, covariance is not positive definite: {e}")
+        else:
+            posterior.add_groups(log_likelihood=log_lik)
+            save_inference_data(posterior, model_fp / "posterior", **save_options)
+            logger.info("Pointwise log-likelihood saved")
+
     logger.info("Saving model as plate diagram")
     graph = pm.model_to_graphviz(model)
     graph.format = "svg"
-    graph.render(figure_fp / "plate_diagram")
+    graph.render(figure_fp / ("plate_diagram" if model_name == "gp" else f"plate_diagram_{model_name}"))
     logger.info("Plate diagram saved")
 
-
-if __name__ == "__main__":
-    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
-
-    main()
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+import click
+
+
+def require_files(*filepaths):
+    """Raise click.FileError for the first of 'filepaths' that does not exist"""
+    for fp in filepaths:
+        if not fp.exists():
+            raise click.FileError(str(fp), hint="file not found")
@@ -2,8 +2,6 @@
 import logging
 from pathlib import Path
 
-import schemdraw
-from schemdraw import flow
 import click
 
 
@@ -18,6 +16,9 @@ def main(
     logger = logging.getLogger(__name__)
     figure_fp = Path(figure_filepath)
 
+    import schemdraw
+    from schemdraw import flow
+
     logger.info("Drawing flowchart")
     with schemdraw.Drawing(file=figure_fp / "flowchart.svg", show=False) as d:
         d.config(fontsize=12)
@@ -29,9 +30,3 @@ def main(
         d += flow.Arrow().down(d.unit / 2)
         d += flow.Box(w=4).label("Multilevel regression")
 
-
-if __name__ == "__main__":
-    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
-
-    main()
@@ -3,9 +3,30 @@ import logging
 from pathlib import Path
 
 import click
-import geopandas as gpd
-import arviz as az
-import matplotlib.pyplot as plt
+
+from src.utils import require_files
+
+
+def load_inference_data(filepath, var_names):
+    """
+    Read only the groups and variables in 'var_names' from a netcdf file,
+    None selects every variable of the group. Missing groups are skipped.
+    """
+    import arviz as az
+    import netCDF4
+    import xarray as xr
+
+    if not filepath.exists():
+        return az.InferenceData()
+    with netCDF4.Dataset(filepath) as root:
+        saved_groups = set(root.groups)
+    groups = {}
+    for group, names in var_names.items():
+        if group not in saved_groups:
+            continue
+        with xr.open_dataset(filepath, group=group) as dataset:
+            groups[group] = (dataset if names is None else dataset[names]).load()
+    return az.InferenceData(**groups)
 
 
 @click.command()
@@ -24,14 +45,22 @@ def main(
     data_fp = Path(input_filepath)
     model_fp = Path(model_filepath)
     figure_fp = Path(figure_filepath)
+    require_files(data_fp / "spatial_income_1880.gpkg", data_fp / "water_1913.gpkg", model_fp / "posterior")
+
+    import geopandas as gpd
+    import arviz as az
+    import matplotlib.pyplot as plt
 
     data = gpd.read_file(data_fp / "spatial_income_1880.gpkg")
     water = gpd.read_file(data_fp / "water_1913.gpkg")
 
-    prior = az.InferenceData.from_netcdf(model_fp / "prior")
-    posterior = az.InferenceData.from_netcdf(model_fp / "posterior")
-    posterior_prediction = az.InferenceData.from_netcdf(
-        model_fp / "posterior_prediction"
+    posterior = load_inference_data(
+        model_fp / "posterior",
+        {"posterior": None, "sample_stats": ["diverging"]},
+    )
+    posterior_prediction = load_inference_data(
+        model_fp / "posterior_prediction",
+        {"posterior_predictive": ["O"], "observed_data": ["O"]},
     )
 
     logger.info("Plotting posterior distribution")
@@ -58,6 +87,10 @@ def main(
     posterior_summary = az.summary(posterior, hdi_prob=0.95)
     posterior_summary.to_csv(figure_fp / "posterior_summary.csv")
 
+    if not {"posterior_predictive", "observed_data"} <= set(posterior_prediction.groups()):
+        logger.info("No posterior predictive samples saved, skipping posterior predictive checks")
+        return
+
     logger.info("Saving posterior predictive checks")
     ppc = az.plot_ppc(
         posterior_prediction,
@@ -67,9 +100,3 @@ def main(
     plt.tight_layout()
     plt.savefig(figure_fp / "posterior_predictive_check.png", dpi=300)
 
-
-if __name__ == "__main__":
-    log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_fmt)
-
-    main()